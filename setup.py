@@ -11,7 +11,11 @@ test_packages = [
     "black>=19.3b0",
 ]
 
-all_packages = base_packages
+parquet_packages = ["pyarrow>=8.0.0"]
+
+orjson_packages = ["orjson>=3.8.0"]
+
+all_packages = base_packages + parquet_packages + orjson_packages
 dev_packages = all_packages + test_packages
 
 
@@ -30,7 +34,11 @@ setup(
         "Issue Tracker": "https://github.com/koaning/simsity/issues",
     },
     install_requires=base_packages,
-    extras_require={"dev": dev_packages},
+    extras_require={
+        "parquet": parquet_packages,
+        "orjson": orjson_packages,
+        "dev": dev_packages,
+    },
     classifiers=[
         "Intended Audience :: Science/Research",
         "Programming Language :: Python :: 3",
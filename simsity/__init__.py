@@ -1,14 +1,34 @@
 from queue import LifoQueue
 import datetime as dt
-import itertools as it
+import functools
+import gzip
+import logging
+import math
 from pathlib import Path
 from typing import Iterable, Protocol, Callable, Union, Any, Dict, Optional
 
+import numpy as np
 import srsly
 from hnswlib import Index
 from tqdm import tqdm
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
 DB_NAME = "db.gz.json"
+PARQUET_NAME = "db.parquet"
 INDEX_NAME = "index.bin"
 METADATA_NAME = "metadata.json"
 
@@ -21,28 +41,152 @@ class Transformer(Protocol):
 EncType = Union[Callable, Transformer]
 
 
+class ColumnarDB:
+    """
+    Column-wise storage for tabular data.
+
+    Keeps one array per column instead of one dict per row, which is a lot
+    lighter on memory for larger corpora. Rows only get materialized into
+    dicts when they come back as query results.
+    """
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.columns = list(data.keys())
+        self.data = {c: np.asarray(data[c], dtype=object) for c in self.columns}
+
+    def __len__(self) -> int:
+        return len(self.data[self.columns[0]]) if self.columns else 0
+
+    def __getitem__(self, i) -> Dict[str, Any]:
+        return {c: self.data[c][i] for c in self.columns}
+
+    def take(self, indices: list) -> list:
+        """
+        Materialize a batch of rows as dicts.
+
+        Gathers column-by-column first, so we pay one fancy-index per column
+        rather than one `__getitem__` per cell.
+        """
+        taken = {c: self.data[c][indices] for c in self.columns}
+        return [{c: taken[c][j] for c in self.columns} for j in range(len(indices))]
+
+    def to_dict(self) -> Dict[str, list]:
+        """Column-oriented representation that json can handle."""
+        return {c: self.data[c].tolist() for c in self.columns}
+
+
+class ArrowDB:
+    """
+    Read-only storage backed by a memory-mapped arrow table.
+
+    Nothing is parsed up front when loading from disk; rows are pulled out
+    of the mapped file only once they show up in query results.
+    """
+
+    def __init__(self, table) -> None:
+        self.table = table
+        self.columns = table.column_names
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def __getitem__(self, i) -> Dict[str, Any]:
+        return {c: self.table[c][i].as_py() for c in self.columns}
+
+    def take(self, indices: list) -> list:
+        """Materialize a batch of rows as dicts via arrow's own take."""
+        return self.table.take(indices).to_pylist()
+
+
 class SimSityIndex:
     """Object for easy querying."""
 
-    def __init__(self, index: Index, encoder: EncType, db: Dict[int, Any]) -> None:
+    def __init__(
+        self, index: Index, encoder: EncType, db: Union[list, ColumnarDB, ArrowDB]
+    ) -> None:
         self.index = index
         self.encoder = encoder
         self.db = db
+        # Resolve the callable-vs-transformer dispatch once here, instead
+        # of re-checking it on every single query.
+        self._encode = encoder if callable(encoder) else encoder.transform
+        # Query workloads tend to repeat themselves, and encoding is the
+        # dominant per-query cost. A small cache skips it on repeats.
+        self._encode_cached = functools.lru_cache(maxsize=1024)(
+            lambda q: self._encode([q])
+        )
 
-    def query(self, query: Union[str, Dict], n: int = 10):
+    def query(self, query: Union[str, Dict], n: int = 10, out: str = "tuple"):
         """
         Query using approximate nearest neighbors
 
         The object handles the encoder/data from disk.
+
+        Pass `out="dataframe"` to get the results as a single dataframe with
+        a `dist` column instead of a `(items, dists)` tuple. Needs pandas.
         """
-        arr = encode_data(self.encoder, query)
-        return self.query_vector(query=arr, n=n)
+        logger.debug("query=%r n=%d", query, n)
+        if isinstance(query, np.ndarray):
+            # Already a vector, no need to pay for the encoder.
+            return self.query_vector(query=query, n=n, out=out)
+        if isinstance(query, str):
+            # A single item is encoded as a batch of one, so that sklearn-style
+            # encoders don't need a wrapper object on the hot path. Strings
+            # are hashable, so they also get the lru cache.
+            arr = self._encode_cached(query)
+        elif isinstance(query, dict):
+            arr = self._encode([query])
+        else:
+            arr = self._encode(query)
+        return self.query_vector(query=arr, n=n, out=out)
+
+    def _items(self, labels: list) -> list:
+        """Fetch the stored items for a list of index positions."""
+        db = self.db
+        if isinstance(db, (ColumnarDB, ArrowDB)):
+            return db.take(labels)
+        return [db[label] for label in labels]
+
+    def _as_dataframe(self, labels: list, dists: list):
+        """Build a result dataframe column-wise, without per-row dicts."""
+        import pandas as pd
 
-    def query_vector(self, query: Union[str, Dict], n: int = 10):
+        db = self.db
+        if isinstance(db, ColumnarDB):
+            cols = {c: db.data[c][labels] for c in db.columns}
+        elif isinstance(db, ArrowDB):
+            cols = db.table.take(labels).to_pydict()
+        else:
+            cols = {"item": [db[label] for label in labels]}
+        cols["dist"] = dists
+        return pd.DataFrame(cols)
+
+    def query_vector(self, query: Union[str, Dict], n: int = 10, out: str = "tuple"):
         """Query using a vector."""
-        labels, distances = self.index.knn_query(query, k=n)
-        out = [self.db[label] for label in labels[0]]
-        return out, list(distances[0])
+        labels, distances = self.index.knn_query(as_float32(query), k=n)
+        labels0 = labels[0].tolist()
+        dists = distances[0].tolist()
+        if out == "dataframe":
+            return self._as_dataframe(labels0, dists)
+        return self._items(labels0), dists
+
+    def query_batch(self, queries, n: int = 10):
+        """
+        Query multiple items in one go.
+
+        The queries are encoded in a single encoder call and handed to the
+        index as one batch, which amortizes the per-query overhead.
+        Returns a list of `(items, dists)` pairs, one per query.
+        """
+        if isinstance(queries, np.ndarray):
+            arr = queries
+        else:
+            arr = self._encode(queries)
+        labels, distances = self.index.knn_query(as_float32(arr), k=n)
+        return [
+            (self._items(row.tolist()), dists.tolist())
+            for row, dists in zip(labels, distances)
+        ]
 
     def walk(self, *args, n=10, depth=3, uniq_id=lambda d: d):
         """Walk through the index, finding nearest neighbors of nearest neighbors.
@@ -55,23 +199,24 @@ class SimSityIndex:
         - uniq_id: function that can determine the uniqness of the item (must be hashable)
         """
         q = LifoQueue()
-        seen = {}
+        seen = set()
 
         for i in range(depth):
             new_args = []
 
             for arg in args:
-                res, dists = self.index.query(arg, n=n)
+                res, dists = self.query(arg, n=n)
                 for item in res:
                     q.put(item)
 
             if depth != 0:
                 while not q.empty():
                     item = q.get()
-                    if uniq_id(item) not in seen:
+                    key = uniq_id(item)
+                    if key not in seen:
                         yield item
                         new_args.append(item)
-                        seen[uniq_id(item)] = 1
+                        seen.add(key)
             args = new_args
 
 
@@ -88,6 +233,35 @@ def encode_data(encoder, data):
         return encoder.transform(data)
 
 
+def write_gzip_json(location, data):
+    """Like srsly.write_gzip_json, but uses orjson when it's available."""
+    if orjson is None:
+        srsly.write_gzip_json(location, data)
+        return
+    with gzip.open(str(location), "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY))
+
+
+def read_gzip_json(location):
+    """Like srsly.read_gzip_json, but uses orjson when it's available."""
+    if orjson is None:
+        return srsly.read_gzip_json(location)
+    with gzip.open(str(location), "rb") as f:
+        return orjson.loads(f.read())
+
+
+def as_float32(arr):
+    """
+    Cast an encoded array to contiguous float32.
+
+    hnswlib works on float32 internally, so doing the conversion up front
+    halves the bytes moved and avoids a copy-convert inside the index.
+    """
+    if isinstance(arr, np.ndarray) and arr.dtype != np.float32:
+        return np.ascontiguousarray(arr, dtype=np.float32)
+    return arr
+
+
 def create_index(
     data: list,
     encoder: Union[Transformer, Callable],
@@ -95,24 +269,43 @@ def create_index(
     space: str = "cosine",
     pbar: bool = True,
     batch_size: int = 500,
+    ef_construction: int = 200,
+    M: int = 16,
 ):
     """
     Creates a simple ANN index. Uses hnswlib under the hood.
     You need to provide a scikit-learn compatible encoder for the data manually.
+
+    You may also pass a dataframe as `data`. The rows are then stored
+    column-wise and queries return them as dictionaries.
+
+    The `ef_construction` and `M` settings are handed to hnswlib and trade
+    recall against build time and index memory. The defaults are fine for
+    medium sized datasets; for larger corpora you may want to turn them up.
     """
+    is_dataf = hasattr(data, "columns") and hasattr(data, "to_dict")
+    if is_dataf:
+        db = ColumnarDB({c: data[c] for c in data.columns})
+    else:
+        # Positions are contiguous, so a plain list beats an int-keyed dict:
+        # no hashing on lookup and way less memory per entry.
+        db = list(data)
     index = None
     dim = 0
     batches = batch(data, batch_size)
     if pbar:
-        batches, batches_copy = it.tee(batches)
-        total = sum(1 for _ in batches_copy)
+        # The number of batches follows from len(data), no need to walk
+        # the generator twice just to count them.
+        total = math.ceil(len(data) / batch_size)
         batches = tqdm(batches, desc="indexing", total=total)
     for b in batches:
-        encoded = encode_data(encoder, b)
+        encoded = as_float32(encode_data(encoder, b))
         if not index:
             dim = encoded.shape[1]
             index = Index(space=space, dim=dim)
-            index.init_index(max_elements=len(data))
+            index.init_index(
+                max_elements=len(data), ef_construction=ef_construction, M=M
+            )
         index.add_items(encoded)
     if not index:
         raise RuntimeError(
@@ -121,22 +314,35 @@ def create_index(
     if path:
         path = Path(path)
         path.mkdir(parents=True, exist_ok=True)
-        if (path / DB_NAME).exists():
-            (path / DB_NAME).unlink()
-        srsly.write_gzip_json(path / DB_NAME, {i: item for i, item in enumerate(data)})
+        for old in (path / DB_NAME, path / PARQUET_NAME):
+            if old.exists():
+                old.unlink()
+        if is_dataf and HAS_PYARROW:
+            # Parquet gives us dictionary-encoded columns on disk, which is
+            # both smaller and faster to read back than gzipped json.
+            pq.write_table(pa.table(db.to_dict()), str(path / PARQUET_NAME))
+            storage = "parquet"
+        elif is_dataf:
+            write_gzip_json(path / DB_NAME, db.to_dict())
+            storage = "columnar"
+        else:
+            write_gzip_json(path / DB_NAME, db)
+            storage = "records"
         index.save_index(str(path / INDEX_NAME))
         metadata = {
             "created": str(dt.datetime.now())[:19],
             "dim": dim,
             "n_items": len(data),
             "space": space,
+            "storage": storage,
+            "ef_construction": ef_construction,
+            "M": M,
             "encoder": str(encoder),
         }
         srsly.write_json(
             path / METADATA_NAME,
             metadata,
         )
-    db = {i: k for i, k in enumerate(data)}
     return SimSityIndex(index=index, encoder=encoder, db=db)
 
 
@@ -146,5 +352,21 @@ def load_index(path: Union[str, Path], encoder: EncType):
     metadata = srsly.read_json(path / METADATA_NAME)
     index = Index(space=metadata["space"], dim=metadata["dim"])
     index.load_index(str(path / INDEX_NAME))
-    db = {int(i): k for i, k in srsly.read_gzip_json(path / DB_NAME).items()}
+    storage = metadata.get("storage")
+    if storage == "parquet":
+        if not HAS_PYARROW:
+            raise ModuleNotFoundError(
+                "This index stores its data as parquet. To load it you'll need to install via;\n\n"
+                "pip install simsity[parquet]"
+            )
+        db = ArrowDB(pq.read_table(str(path / PARQUET_NAME), memory_map=True))
+    elif storage == "columnar":
+        db = ColumnarDB(read_gzip_json(path / DB_NAME))
+    else:
+        loaded = read_gzip_json(path / DB_NAME)
+        if isinstance(loaded, list):
+            db = loaded
+        else:
+            # Older indices stored a dict keyed on stringified positions.
+            db = [loaded[str(i)] for i in range(len(loaded))]
     return SimSityIndex(index=index, encoder=encoder, db=db)
@@ -0,0 +1,149 @@
+"""
+These tests use a small deterministic encoder, so that they can run without
+downloading a model or any data. That way every storage format gets a
+round-trip check in CI.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import srsly
+
+import simsity
+from simsity import DB_NAME, METADATA_NAME, PARQUET_NAME, create_index, load_index
+
+texts = [
+    "pork belly buns",
+    "slow roasted pork",
+    "chicken noodle soup",
+    "spicy chicken wings",
+    "vegetable stir fry",
+    "pork and beans",
+]
+
+
+def featurize(text):
+    return [len(text), sum(ord(ch) for ch in text) % 101, text.count("pork")]
+
+
+def encoder(data):
+    """Deterministic toy encoder that handles strings, dicts and dataframes."""
+    if hasattr(data, "columns"):
+        items = list(data["text"])
+    else:
+        items = [r["text"] if isinstance(r, dict) else r for r in data]
+    return np.array([featurize(t) for t in items], dtype=np.float32)
+
+
+def make_dataf():
+    return pd.DataFrame({"text": texts, "rating": list(range(len(texts)))})
+
+
+def test_records_roundtrip(tmpdir):
+    index = create_index(texts, encoder, path=tmpdir, pbar=False)
+    out1, dist1 = index.query("pork belly", n=3)
+
+    loaded = load_index(path=tmpdir, encoder=encoder)
+    assert isinstance(loaded.db, list)
+    out2, dist2 = loaded.query("pork belly", n=3)
+    assert out1 == out2
+    assert dist1 == dist2
+
+
+def test_columnar_json_roundtrip(tmpdir, monkeypatch):
+    # Without pyarrow a dataframe db falls back to column-oriented gzip json.
+    monkeypatch.setattr(simsity, "HAS_PYARROW", False)
+    index = create_index(make_dataf(), encoder, path=tmpdir, pbar=False)
+    assert isinstance(index.db, simsity.ColumnarDB)
+    assert (Path(tmpdir) / DB_NAME).exists()
+    out1, _ = index.query({"text": "pork belly"}, n=3)
+
+    loaded = load_index(path=tmpdir, encoder=encoder)
+    assert isinstance(loaded.db, simsity.ColumnarDB)
+    out2, _ = loaded.query({"text": "pork belly"}, n=3)
+    assert out1 == out2
+    assert set(out1[0].keys()) == {"text", "rating"}
+
+
+@pytest.mark.skipif(not simsity.HAS_PYARROW, reason="pyarrow is not installed")
+def test_parquet_roundtrip(tmpdir):
+    index = create_index(make_dataf(), encoder, path=tmpdir, pbar=False)
+    assert (Path(tmpdir) / PARQUET_NAME).exists()
+    out1, dist1 = index.query({"text": "pork belly"}, n=3)
+
+    loaded = load_index(path=tmpdir, encoder=encoder)
+    assert isinstance(loaded.db, simsity.ArrowDB)
+    out2, dist2 = loaded.query({"text": "pork belly"}, n=3)
+    assert out1 == out2
+    assert dist1 == dist2
+
+
+def test_query_batch_matches_single_queries():
+    index = create_index(texts, encoder, pbar=False)
+    queries = ["pork belly", "chicken soup", "stir fry"]
+
+    batched = index.query_batch(queries, n=3)
+    assert len(batched) == len(queries)
+    for query, (items, dists) in zip(queries, batched):
+        single_items, single_dists = index.query(query, n=3)
+        assert items == single_items
+        assert dists == single_dists
+
+
+def test_dataframe_out_list_db():
+    index = create_index(texts, encoder, pbar=False)
+    res = index.query("pork belly", n=3, out="dataframe")
+    assert list(res.columns) == ["item", "dist"]
+
+    items, dists = index.query("pork belly", n=3)
+    assert list(res["item"]) == items
+    assert list(res["dist"]) == dists
+
+
+def test_dataframe_out_columnar_db():
+    index = create_index(make_dataf(), encoder, pbar=False)
+    res = index.query({"text": "pork belly"}, n=3, out="dataframe")
+    assert list(res.columns) == ["text", "rating", "dist"]
+
+    items, dists = index.query({"text": "pork belly"}, n=3)
+    assert res.drop(columns="dist").to_dict(orient="records") == items
+    assert list(res["dist"]) == dists
+
+
+@pytest.mark.skipif(not simsity.HAS_PYARROW, reason="pyarrow is not installed")
+def test_dataframe_out_arrow_db(tmpdir):
+    create_index(make_dataf(), encoder, path=tmpdir, pbar=False)
+    loaded = load_index(path=tmpdir, encoder=encoder)
+    assert isinstance(loaded.db, simsity.ArrowDB)
+
+    res = loaded.query({"text": "pork belly"}, n=3, out="dataframe")
+    assert list(res.columns) == ["text", "rating", "dist"]
+
+    items, dists = loaded.query({"text": "pork belly"}, n=3)
+    assert res.drop(columns="dist").to_dict(orient="records") == items
+    assert list(res["dist"]) == dists
+
+
+def test_walk_yields_unique_items():
+    index = create_index(texts, encoder, pbar=False)
+    found = list(index.walk("pork belly", n=3, depth=2))
+    assert len(found) > 0
+    assert len(found) == len(set(found))
+
+
+def test_load_legacy_dict_db(tmpdir):
+    index = create_index(texts, encoder, path=tmpdir, pbar=False)
+    # Rewrite the files the way simsity<=0.5.5 stored them: a db dict keyed
+    # on stringified positions and a metadata file without a storage field.
+    srsly.write_gzip_json(
+        Path(tmpdir) / DB_NAME, {str(i): t for i, t in enumerate(texts)}
+    )
+    metadata = srsly.read_json(Path(tmpdir) / METADATA_NAME)
+    metadata.pop("storage")
+    srsly.write_json(Path(tmpdir) / METADATA_NAME, metadata)
+
+    loaded = load_index(path=tmpdir, encoder=encoder)
+    assert loaded.db == texts
+    out, _ = loaded.query("pork belly", n=3)
+    assert out == index.query("pork belly", n=3)[0]